@@ -2,54 +2,162 @@ import streamlit as st
 import pandas as pd
 import numpy as np
 import plotly.graph_objects as go
+import os
+import tempfile
+from concurrent.futures import ThreadPoolExecutor
+import pyarrow.parquet as pq
 from datetime import datetime
 
 # --- 1. SETTINGS ---
 st.set_page_config(page_title="Jumbo Homes | Internal Tool", layout="wide")
 
 # --- 2. DATA LOADING (Pulling categorical dates from tables) ---
-@st.cache_data
-def load_and_standardize():
-    f_map = {
-        'owners': 'Owners.csv', 'visits': 'Visits.csv', 'buyers': 'Buyers.csv',
-        'inspections': 'home_inspection.csv', 'homes': 'Homes.csv',
-        'catalogue': 'home_catalogue.csv', 'price_hist': 'price-history-new.csv',
-        'offers': 'offers.csv', 'admins': 'Admins.csv'
-    }
-    
-    data = {k: pd.read_csv(v) for k, v in f_map.items()}
+# Low-cardinality columns used in filters/groupbys, parsed straight to category codes
+CATEGORY_COLS = {
+    'visits': ['Internal/Year', 'Internal/Month', 'Internal/Week', 'Visit_location', 'Internal/LeadOwner', 'WA_Msg/VA_Name'],
+    'owners': ['Internal/Year', 'Internal/Month', 'Internal/Week', 'Locality', 'Status'],
+    'buyers': ['Dates/Current-Year', 'Dates/Created_month', 'Dates/Created_week', 'Location/Locality'],
+    'homes': ['Internal/Year', 'Internal/Week', 'Building/Locality', 'Internal/Status'],
+    'inspections': ['Inspected By']
+}
+
+# (Year, Month, Week) bucket columns per table; tables are sorted on these once at load.
+# None = the export has no such level: sorting and filtering skip it (homes: Year -> Week)
+PERIOD_COLS = {
+    'visits': ('Internal/Year', 'Internal/Month', 'Internal/Week'),
+    'owners': ('Internal/Year', 'Internal/Month', 'Internal/Week'),
+    'buyers': ('Dates/Current-Year', 'Dates/Created_month', 'Dates/Created_week'),
+    'homes': ('Internal/Year', None, 'Internal/Week')  # Homes.csv has no month bucket
+}
+
+# Columns each table actually needs (None = keep every column); a listed column missing from the export fails the load
+NEEDED_COLS = {
+    'visits': ['Internal/Year', 'Internal/Month', 'Internal/Week', 'Visit_location', 'Internal/LeadOwner', 'WA_Msg/VA_Name',
+               'Lead Phone', 'Status/Visit Completed', 'Homes_Visited'],
+    'owners': ['Internal/Year', 'Internal/Month', 'Internal/Week', 'Locality', 'Status'],
+    'buyers': ['Dates/Current-Year', 'Dates/Created_month', 'Dates/Created_week', 'Location/Locality'],
+    'homes': ['Internal/Year', 'Internal/Week', 'Building/Locality', 'Internal/Status', 'Home/Ask_Price (lacs)'],
+    'inspections': ['Inspected By'],
+    'catalogue': ['Media/Floor Plan'],
+    'admins': ['First Name', 'Email', 'Role']
+}
+
+def read_csv_cached(path, usecols=None, dtype=None):
+    # Parquet sidecar: parse the CSV once, reuse the typed columnar copy until the CSV changes
+    header = pd.read_csv(path, nrows=0).columns
+    missing = [c for c in (usecols or []) if c not in header]
+    if missing:
+        raise ValueError(f"{path} is missing required columns: {missing}")
+    cols = [c for c in header if usecols is None or c in usecols]
+    pq_path = path + '.parquet'
+    if os.path.exists(pq_path) and os.path.getmtime(pq_path) >= os.path.getmtime(path):
+        try:
+            if set(cols) <= set(pq.read_schema(pq_path).names):
+                df = pd.read_parquet(pq_path, engine='pyarrow', columns=cols)
+                return df.astype({c: t for c, t in (dtype or {}).items() if c in df})
+        except (OSError, ValueError):
+            pass  # truncated/corrupt sidecar (ArrowInvalid is a ValueError): re-parse the CSV and overwrite it
+    df = pd.read_csv(path, usecols=cols, dtype=dtype)
+    # Write to a temp file in the same folder and swap it in, so readers never see a half-written sidecar
+    tmp_path = None
+    try:
+        fd, tmp_path = tempfile.mkstemp(dir=os.path.dirname(os.path.abspath(pq_path)), suffix='.parquet.tmp')
+        os.close(fd)
+        df.to_parquet(tmp_path, engine='pyarrow', compression='zstd')
+        os.replace(tmp_path, pq_path)
+    except (OSError, TypeError, ValueError, ImportError):
+        # read-only folder or un-serializable column: keep serving from CSV
+        if tmp_path and os.path.exists(tmp_path): os.remove(tmp_path)
+    return df
+
+# Source exports by table key (the loader is parameterized on this map)
+DATA_FILES = {
+    'owners': 'Owners.csv', 'visits': 'Visits.csv', 'buyers': 'Buyers.csv',
+    'inspections': 'home_inspection.csv', 'homes': 'Homes.csv',
+    'catalogue': 'home_catalogue.csv', 'price_hist': 'price-history-new.csv',
+    'offers': 'offers.csv', 'admins': 'Admins.csv'
+}
+
+# Shared read-only across sessions (no pickle round-trip per rerun), one entry per file map - never mutate `data` in place.
+# `version` only keys the cache: a replaced export reloads, and the superseded entry is evicted
+@st.cache_resource(max_entries=1)
+def load_and_standardize(f_map, version):
+    # Files are independent, so parse/read them concurrently (CSV and Parquet readers release the GIL)
+    with ThreadPoolExecutor(max_workers=min(len(f_map), os.cpu_count() or 1)) as pool:
+        futures = {k: pool.submit(read_csv_cached, v, usecols=NEEDED_COLS.get(k), dtype={c: 'category' for c in CATEGORY_COLS.get(k, [])}) for k, v in f_map.items()}
+        data = {k: f.result() for k, f in futures.items()}
+
+    # Sort by period codes (NaN first) so every Year / Year+Month / Year+Month+Week is one contiguous block
+    for k, cols in PERIOD_COLS.items():
+        data[k] = data[k].sort_values([c for c in cols if c is not None], na_position='first', kind='stable', ignore_index=True)
+
+    # Email -> Name lookup (normalized keys, resolved once per row via a hashed map)
+    admins_w_email = data['admins'].dropna(subset=['Email'])
+    email_to_name = dict(zip(admins_w_email['Email'].str.strip().str.lower(), admins_w_email['First Name']))
+
+    # Admins with no Email: claim an unmapped email whose local part contains each name token's first 5 chars (unique hits only).
+    # Tokens under 3 chars ("Om", "YC") are too short to be evidence, so names made only of them never match
+    no_email = {n: [t for t in n.lower().split() if len(t) >= 3] for n in data['admins'].loc[data['admins']['Email'].isna(), 'First Name'].dropna()}
+    seen = pd.concat([data['visits']['Internal/LeadOwner'], data['inspections']['Inspected By']]).dropna().astype(str).str.strip().str.lower().unique()
+    for email in seen:
+        if email in email_to_name: continue
+        local = email.split('@')[0]
+        hits = [n for n, toks in no_email.items() if toks and all(t[:5] in local for t in toks)]
+        if len(hits) == 1: email_to_name[email] = hits[0]
+    def to_name(s):
+        # Unmapped emails keep their raw value; blanks become "Unknown"
+        return s.astype(str).str.strip().str.lower().map(email_to_name).fillna(s.astype(object)).where(s.notna(), "Unknown")
 
     # Standardize Column Naming for Filtering
     # Visits
-    data['visits']['Project'] = data['visits']['Homes_Visited'].astype(str).apply(lambda x: x.split('_')[0] if '_' in x else "Unknown")
-    data['visits']['is_comp'] = (data['visits']['Status/Visit Completed'] == True)
+    hv = data['visits']['Homes_Visited'].astype('string')
+    data['visits']['Project'] = hv.str.split('_', n=1).str[0].where(hv.str.contains('_', regex=False, na=False), "Unknown").astype('category')
+    # Completed = flag set (missing counts as not completed); plain numpy bool
+    data['visits']['Status/Visit Completed'] = data['visits']['Status/Visit Completed'].map({True: True, False: False, 'True': True, 'False': False, 'true': True, 'false': False}).astype('boolean')
+    data['visits']['is_comp'] = data['visits']['Status/Visit Completed'].fillna(False).to_numpy(dtype=bool)
+    data['visits']['_owner'] = to_name(data['visits']['Internal/LeadOwner']).astype('category')
+
+    # Inspections
+    data['inspections']['_inspector'] = to_name(data['inspections']['Inspected By']).astype('category')
     
+    # Homes: ask price parsed to float once (exports mix numbers and text)
+    data['homes']['Home/Ask_Price (lacs)'] = pd.to_numeric(data['homes']['Home/Ask_Price (lacs)'], errors='coerce')
+
     # Catalogue Floor Plan Check
-    data['catalogue']['has_fp'] = data['catalogue']['Media/Floor Plan'].apply(lambda x: 1 if (pd.notna(x) and 'https' in str(x)) else 0)
+    data['catalogue']['has_fp'] = data['catalogue']['Media/Floor Plan'].astype('string').str.contains('https', regex=False, na=False).astype('int8')
 
     # Admin Role Mapping
     data['admins']['Role'] = data['admins']['Role'].fillna('Unknown').str.strip()
+
+    # Sidebar option lists (period hierarchy + locality union via categories, not Python sets)
+    v_periods = data['visits'][['Internal/Year', 'Internal/Month', 'Internal/Week']]
+    data['years'] = sorted(v_periods['Internal/Year'].dropna().unique().tolist(), reverse=True)
+    data['year_months'] = {y: sorted(m.unique().tolist()) for y, m in v_periods.dropna(subset=['Internal/Year', 'Internal/Month']).groupby('Internal/Year', observed=True)['Internal/Month']}
+    data['month_weeks'] = {ym: sorted(w.unique().tolist()) for ym, w in v_periods.dropna().groupby(['Internal/Year', 'Internal/Month'], observed=True)['Internal/Week']}
+    data['localities'] = data['owners']['Locality'].cat.categories.union(data['visits']['Visit_location'].cat.categories).sort_values().tolist()
     
     return data
 
-data = load_and_standardize()
+# CSV mtimes: every cache that reads `data` is keyed on this, so none can outlive the data it was built from
+data_version = tuple(os.path.getmtime(f) for f in DATA_FILES.values())
+data = load_and_standardize(DATA_FILES, data_version)
 
 # --- 3. DYNAMIC SIDEBAR FILTERS ---
 st.sidebar.title("🔍 Deep-Dive Filters")
 
 # Date Filters derived from categorical columns in Visits.csv
-avail_years = sorted(data['visits']['Internal/Year'].dropna().unique().tolist(), reverse=True)
+# Year -> Month -> Week options are precomputed in the loader; each rerun is a dict lookup
+avail_years = data['years']
 sel_year = st.sidebar.selectbox("Filter by Year", [None] + avail_years, index=1 if len(avail_years) > 0 else 0)
 
-avail_months = sorted(data['visits'][data['visits']['Internal/Year'] == sel_year]['Internal/Month'].dropna().unique().tolist()) if sel_year else []
+avail_months = data['year_months'].get(sel_year, []) if sel_year else []
 sel_month = st.sidebar.selectbox("Filter by Month", [None] + avail_months)
 
-avail_weeks = sorted(data['visits'][(data['visits']['Internal/Year'] == sel_year) & (data['visits']['Internal/Month'] == sel_month)]['Internal/Week'].dropna().unique().tolist()) if sel_month else []
+avail_weeks = data['month_weeks'].get((sel_year, sel_month), []) if sel_month else []
 sel_week = st.sidebar.selectbox("Filter by Week", [None] + avail_weeks)
 
 # Locality Filter (Consolidated)
-localities = sorted(list(set(data['owners']['Locality'].dropna()) | set(data['visits']['Visit_location'].dropna())))
-sel_loc = st.sidebar.multiselect("Locality Analysis", localities)
+sel_loc = st.sidebar.multiselect("Locality Analysis", data['localities'])
 
 # Agent Filter (Restricted to Buyer Agent & BSA)
 target_roles = ['Buyer Agent', 'BSA', 'Buyer Success Agent']
@@ -59,17 +167,46 @@ sel_agents = st.sidebar.multiselect("Agent Analysis", agent_list)
 
 # --- 4. DATA FILTERING ENGINE ---
 def filter_df(df, y_col, m_col, w_col, l_col=None):
-    df_f = df.copy()
-    if sel_year: df_f = df_f[df_f[y_col] == sel_year]
-    if sel_month: df_f = df_f[df_f[m_col] == sel_month]
-    if sel_week: df_f = df_f[df_f[w_col] == sel_week]
-    if sel_loc and l_col: df_f = df_f[df_f[l_col].isin(sel_loc)]
+    # Period levels narrow a contiguous row range via searchsorted on the sorted category codes (a view, no copy)
+    lo, hi = 0, len(df)
+    for col, val in ((y_col, sel_year), (m_col, sel_month), (w_col, sel_week)):
+        if not val: break  # hierarchy: month needs a year, week needs a month
+        if col is None: continue  # level not in this table (homes month): keep narrowing by the next one
+        code = df[col].cat.categories.get_indexer([val])[0]
+        if code < 0: return df.iloc[0:0]
+        codes = df[col].cat.codes.to_numpy()[lo:hi]
+        lo, hi = lo + np.searchsorted(codes, code, 'left'), lo + np.searchsorted(codes, code, 'right')
+    df_f = df.iloc[lo:hi]
+    if sel_loc and l_col: df_f = df_f[df_f[l_col].isin(sel_loc).to_numpy()]
     return df_f
 
-v_f = filter_df(data['visits'], 'Internal/Year', 'Internal/Month', 'Internal/Week', 'Visit_location')
-o_f = filter_df(data['owners'], 'Internal/Year', 'Internal/Month', 'Internal/Week', 'Locality')
-b_f = filter_df(data['buyers'], 'Dates/Current-Year', 'Dates/Created_month', 'Dates/Created_week', 'Location/Locality')
-h_f = filter_df(data['homes'], 'Internal/Year', 'Internal/Month', 'Internal/Week', 'Building/Locality')
+@st.cache_data
+def rv_phones(_visits, month, version):
+    # RV = Visited in a different month previously; one pass over all visits per selected month -> hash set for isin
+    return _visits.loc[_visits['Internal/Month'] != month, 'Lead Phone'].dropna().unique()
+
+@st.cache_data
+def compute_leaderboard(_v_f, _v_comp, year, month, week, locs, roster, version):
+    # Cached on the filter selections that produced _v_f/_v_comp plus the data version; manual overrides are added by the caller
+    rv_set = rv_phones(data['visits'], month, version)
+
+    # Point Logic (Lead Owner side) - one row per (agent, phone), 7 pts for RV else 3
+    lo_phones = _v_comp.dropna(subset=['Lead Phone']).drop_duplicates(['_owner', 'Lead Phone'])
+    lo_pts = pd.Series(np.where(lo_phones['Lead Phone'].isin(rv_set), 7, 3), index=lo_phones.index).groupby(lo_phones['_owner'], observed=True).sum()
+
+    return pd.DataFrame({
+        "LO Pts": lo_pts,
+        "Scheduled": _v_f.groupby('_owner', observed=True)['Lead Phone'].nunique(),
+        "Completed": lo_phones['_owner'].value_counts(),
+        "Managed (VA)": _v_comp['WA_Msg/VA_Name'].value_counts(),
+        "Inspections": data['inspections']['_inspector'].value_counts()
+    }).reindex(list(roster)).fillna(0).astype(int)
+
+v_f = filter_df(data['visits'], *PERIOD_COLS['visits'], 'Visit_location')
+o_f = filter_df(data['owners'], *PERIOD_COLS['owners'], 'Locality')
+b_f = filter_df(data['buyers'], *PERIOD_COLS['buyers'], 'Location/Locality')
+h_f = filter_df(data['homes'], *PERIOD_COLS['homes'], 'Building/Locality')
+v_comp = v_f[v_f['is_comp'].to_numpy()]  # completed visits, shared by Leaderboard and Demand
 
 # --- 5. VISUALIZATION TABS ---
 tab_lead, tab_supply, tab_sku, tab_demand, tab_admin = st.tabs([
@@ -82,70 +219,54 @@ with tab_admin:
     tour_pts_val = col1.number_input("Pts per Tour", value=20)
     rate_pts_val = col2.number_input("Pts per Google Rating", value=10)
     
-    manual_data = {}
+    # Sparse overrides {person: (tours, ratings)}, kept across reruns even when the person is filtered out
+    manual = st.session_state.setdefault('manual', {})
     for person in (sel_agents if sel_agents else agent_list):
         c1, c2 = st.columns(2)
-        t = c1.number_input(f"Tours: {person}", 0, key=f"t_{person}")
-        r = c2.number_input(f"Ratings: {person}", 0, key=f"r_{person}")
-        manual_data[person] = (t * tour_pts_val) + (r * rate_pts_val)
+        prev_t, prev_r = manual.get(person, (0, 0))
+        t = c1.number_input(f"Tours: {person}", 0, value=prev_t, key=f"t_{person}")
+        r = c2.number_input(f"Ratings: {person}", 0, value=prev_r, key=f"r_{person}")
+        if t or r: manual[person] = (t, r)
+        else: manual.pop(person, None)
+    manual_data = {person: (t * tour_pts_val) + (r * rate_pts_val) for person, (t, r) in manual.items()}
 
 with tab_lead:
     st.header("Buyer Agent & BSA Performance")
     
     
-    leaderboard = []
-    # Use selected agents if any, else all Buyer/BSA
-    for name in (sel_agents if sel_agents else agent_list):
-        # Point Logic (Lead Owner side)
-        agent_v = v_f[(v_f['Internal/LeadOwner'].str.contains(name, na=False, case=False)) & (v_f['is_comp'] == True)]
-        lo_pts = 0
-        for phone, group in agent_v.groupby('Lead Phone'):
-            # RV = Visited in a different month previously
-            is_rv = data['visits'][(data['visits']['Lead Phone'] == phone) & (data['visits']['Internal/Month'] != sel_month)].shape[0] > 0
-            lo_pts += 7 if is_rv else 3
-            
-        # Point Logic (VA side)
-        va_v = v_f[(v_f['WA_Msg/VA_Name'] == name) & (v_f['is_comp'] == True)]
-        va_pts = len(va_v) * 4
-        
-        # Point Logic (Inspection side)
-        insp = data['inspections'][data['inspections']['Inspected By'].str.contains(name, na=False, case=False)]
-        insp_pts = len(insp) * 4
-        
-        leaderboard.append({
-            "Agent": name,
-            "Total Score": lo_pts + va_pts + insp_pts + manual_data.get(name, 0),
-            "Scheduled": v_f[v_f['Internal/LeadOwner'].str.contains(name, na=False)]['Lead Phone'].nunique(),
-            "Completed": agent_v['Lead Phone'].nunique(),
-            "Managed (VA)": len(va_v),
-            "Inspections": len(insp)
-        })
-    
-    st.table(pd.DataFrame(leaderboard).sort_values("Total Score", ascending=False))
+    roster = sel_agents if sel_agents else agent_list
+    board = compute_leaderboard(v_f, v_comp, sel_year, sel_month, sel_week, tuple(sel_loc), tuple(roster), data_version)
+
+    # Point Logic (VA + Inspection side) - 4 pts each, plus manual overrides
+    board["Total Score"] = board["LO Pts"] + board["Managed (VA)"] * 4 + board["Inspections"] * 4 + pd.Series(manual_data, dtype=int).reindex(roster, fill_value=0)
+
+    leaderboard = board.rename_axis("Agent").reset_index()[["Agent", "Total Score", "Scheduled", "Completed", "Managed (VA)", "Inspections"]]
+    st.table(leaderboard.sort_values("Total Score", ascending=False))
 
 with tab_supply:
     st.header("Supply Health")
     
     m1, m2, m3 = st.columns(3)
     m1.metric("Owner Leads", len(o_f))
-    onboarded_owners = len(o_f[o_f['Status'].isin(['Proposal Sent', 'Proposal Accepted'])])
+    onboarded_owners = int(o_f['Status'].isin(['Proposal Sent', 'Proposal Accepted']).sum())
     m2.metric("Owners Onboarded", onboarded_owners)
-    regret = pd.to_numeric(h_f[h_f['Internal/Status'] == 'On Hold']['Home/Ask_Price (lacs)'], errors='coerce').sum()
+    regret = h_f.loc[h_f['Internal/Status'] == 'On Hold', 'Home/Ask_Price (lacs)'].sum()
     m3.metric("Regrettable Loss", f"₹{regret}L")
 
 with tab_sku:
     st.header("Project Performance")
-    st.metric("Live Inventory", len(h_f[h_f['Internal/Status'] == 'Live']))
+    st.metric("Live Inventory", int((h_f['Internal/Status'] == 'Live').sum()))
     st.write("### Top Projects by Visits")
     if not v_f.empty:
-        proj_counts = v_f['Project'].value_counts().head(10)
+        proj_counts = v_f['Project'].value_counts(sort=False)
+        proj_counts = proj_counts[proj_counts > 0].nlargest(10)  # categorical counts include unobserved projects
         st.bar_chart(proj_counts)
 
 with tab_demand:
     st.header("Demand Metrics")
     fig = go.Figure(go.Funnel(
         y = ["Buyer Leads", "Visitors Scheduled", "Visitors Completed"],
-        x = [len(b_f), v_f['Lead Phone'].nunique(), v_f[v_f['is_comp'] == True]['Lead Phone'].nunique()],
+        x = [len(b_f), v_f['Lead Phone'].nunique(), v_comp['Lead Phone'].nunique()],
         textinfo = "value+percent initial"
     ))
     st.plotly_chart(fig, use_container_width=True)